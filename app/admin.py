@@ -4,14 +4,16 @@ from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 import httpx
+from anyio import from_thread
 from fastapi import APIRouter, Request
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import select, func
 
 from jose import jwt
 
 from .db import SessionLocal
-from .models import Ticket, Event, Redemption, AuditLog
+from .models import Ticket, Event, Redemption, AuditLog, AuditRollup
+from .stats import set_issued, get_stats
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -27,9 +29,9 @@ WORDS = [
 
 # --- Offline toggle stored in Redis via main.py's redis client ---
 # We will call the existing /admin/offline endpoints from UI, so we keep them here,
-# but we need a Redis client. We’ll reuse REDIS_URL.
-from redis.asyncio import Redis
-redis = Redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+# but we need a Redis client. We’ll reuse REDIS_URL (plain or cluster).
+from .redis_client import make_redis
+redis = make_redis(decode_responses=True)
 
 
 # -------------------------
@@ -86,6 +88,12 @@ def create_event(req: CreateEventReq):
 
         db.add_all(tickets)
         db.commit()
+        # sync endpoint runs in the threadpool; hop back to the loop for the async Redis client.
+        # Best-effort: the event is committed, and the worker's stats rebuild fills `issued` in.
+        try:
+            from_thread.run(set_issued, redis, event_id, req.ticket_count)
+        except Exception as e:
+            print(f"[admin] set_issued failed event_id={event_id}: {e!r}")
 
         return {
             "ok": True,
@@ -140,6 +148,17 @@ def list_tickets(event_id: str, limit: int = 500):
     finally:
         db.close()
 
+@router.get("/events/{event_id}/stats")
+async def event_stats(event_id: str, minutes: int = 15):
+    """
+    Live per-event counters kept in Redis by /validate and the worker.
+    Returns the last `minutes` one-minute buckets (newest first) alongside the totals.
+    """
+    stats = await get_stats(redis, event_id, minutes=minutes)
+    if stats is None:
+        return {"ok": False, "error": "no stats for event"}
+    return stats
+
 
 # -------------------------
 # Scan ticket (operator UX)
@@ -215,3 +234,34 @@ def get_audit(limit: int = 80, event_id: Optional[str] = None):
     finally:
         db.close()
 
+
+@router.get("/audit/rollups")
+def get_audit_rollups(minutes: int = 60, event_id: Optional[str] = None):
+    """
+    Per-minute decision counts by event/status/reason for the last `minutes`.
+    Served from audit_rollups, so it covers history whose raw audit rows were archived.
+    """
+    db = SessionLocal()
+    try:
+        since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+        q = (
+            select(AuditRollup.minute, AuditRollup.status, AuditRollup.reason_code, func.sum(AuditRollup.count))
+            .where(AuditRollup.minute >= since)
+            .group_by(AuditRollup.minute, AuditRollup.status, AuditRollup.reason_code)
+            .order_by(AuditRollup.minute.desc())
+        )
+        if event_id:
+            q = q.where(AuditRollup.event_id == event_id)
+        rows = db.execute(q).all()
+
+        return [
+            {
+                "minute": str(minute),
+                "status": status,
+                "reason_code": reason,
+                "count": int(n),
+            }
+            for (minute, status, reason, n) in rows
+        ]
+    finally:
+        db.close()
@@ -1,8 +1,9 @@
 import json
+from .keys import idem_key
 
-async def get_cached_response(redis, idem_key: str):
-    raw = await redis.get(f"idem:{idem_key}")
+async def get_cached_response(redis, event_id: str, key: str):
+    raw = await redis.get(idem_key(event_id, key))
     return json.loads(raw) if raw else None
 
-async def set_cached_response(redis, idem_key: str, response: dict, ttl_seconds: int = 300):
-    await redis.setex(f"idem:{idem_key}", ttl_seconds, json.dumps(response))
+async def set_cached_response(redis, event_id: str, key: str, response: dict, ttl_seconds: int = 300):
+    await redis.setex(idem_key(event_id, key), ttl_seconds, json.dumps(response))
@@ -0,0 +1,40 @@
+import os
+import zlib
+
+# Redis key schema. Everything scoped to an event carries the event_id as a hash tag ({...}),
+# so in Redis Cluster all of an event's keys live in one slot and multi-key scripts work.
+# The offline queue is split into a fixed number of shard streams, each with its own tag,
+# so the backlog spreads across cluster nodes instead of landing on one.
+
+OFFLINE_STREAM_SHARDS = int(os.environ.get("OFFLINE_STREAM_SHARDS", "4"))
+
+
+def idem_key(event_id: str, key: str) -> str:
+    return f"idem:{{{event_id}}}:{key}"
+
+def replay_key(event_id: str, nonce: str) -> str:
+    return f"replay:{{{event_id}}}:{nonce}"
+
+def stats_key(event_id: str) -> str:
+    return f"stats:{{{event_id}}}"
+
+def stats_bucket_key(event_id: str, bucket: int) -> str:
+    return f"stats:{{{event_id}}}:{bucket}"
+
+def rate_limit_key(key: str) -> str:
+    return f"rl:{key}"
+
+
+def offline_shard(event_id: str) -> int:
+    return zlib.crc32(event_id.encode("utf-8")) % OFFLINE_STREAM_SHARDS
+
+def offline_stream_key(shard: int) -> str:
+    return f"offline_validations:{{s{shard}}}"
+
+def worker_last_id_key(shard: int) -> str:
+    # same tag as the stream it tracks
+    return f"worker:last_id:{{s{shard}}}"
+
+# Pre-sharding names; the worker drains these once at startup after an upgrade.
+LEGACY_OFFLINE_STREAM = "offline_validations"
+LEGACY_WORKER_LAST_ID = "worker:last_id"
@@ -2,7 +2,6 @@ import os, uuid
 from fastapi import FastAPI, Header, Request
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from redis.asyncio import Redis
 from sqlalchemy.exc import IntegrityError
 
 from .db import SessionLocal, engine, Base
@@ -10,10 +9,13 @@ from .models import Ticket, Redemption, AuditLog
 from .security import verify_qr_token
 from .rate_limit import token_bucket
 from .idempotency import get_cached_response, set_cached_response
+from .stats import record_decision
+from .retention import ensure_audit_partitions
+from .keys import replay_key, offline_stream_key, offline_shard
+from .redis_client import make_redis
 from .admin import router as admin_router
 
 # --- Config / globals ---
-REDIS_URL = os.environ["REDIS_URL"]
 SECRET = os.environ["TICKET_SIGNING_SECRET"]
 DEFAULT_OFFLINE_MODE = os.environ.get("OFFLINE_MODE", "false").lower() == "true"
 
@@ -21,7 +23,7 @@ DEFAULT_OFFLINE_MODE = os.environ.get("OFFLINE_MODE", "false").lower() == "true"
 app = FastAPI(title="Ticket Security Gate", version="1.0.0")
 
 # Create Redis client after config is available
-redis = Redis.from_url(REDIS_URL, decode_responses=False)
+redis = make_redis(decode_responses=False)
 
 # Mount UI + Admin routes AFTER app exists
 app.mount("/ui", StaticFiles(directory="app/ui", html=True), name="ui")
@@ -29,6 +31,7 @@ app.include_router(admin_router)
 
 # Create DB tables (fine to do at import-time for demo)
 Base.metadata.create_all(bind=engine)
+ensure_audit_partitions(engine)
 
 async def is_offline_mode() -> bool:
     val = await redis.get("cfg:offline_mode")
@@ -52,7 +55,7 @@ async def validate_ticket(
 
     # Idempotency
     if idempotency_key:
-        cached = await get_cached_response(redis, idempotency_key)
+        cached = await get_cached_response(redis, req.event_id, idempotency_key)
         if cached:
             return cached
 
@@ -61,7 +64,7 @@ async def validate_ticket(
     if not allowed:
         resp = {"status": "REJECTED", "reason_code": "RATE_LIMITED", "ticket_id": None, "decision_id": decision_id}
         if idempotency_key:
-            await set_cached_response(redis, idempotency_key, resp)
+            await set_cached_response(redis, req.event_id, idempotency_key, resp)
         await _audit(decision_id, ip, ua, req.event_id, None, resp["status"], resp["reason_code"])
         return resp
 
@@ -71,7 +74,7 @@ async def validate_ticket(
     except ValueError as e:
         resp = {"status": "REJECTED", "reason_code": str(e), "ticket_id": None, "decision_id": decision_id}
         if idempotency_key:
-            await set_cached_response(redis, idempotency_key, resp)
+            await set_cached_response(redis, req.event_id, idempotency_key, resp)
         await _audit(decision_id, ip, ua, req.event_id, None, resp["status"], resp["reason_code"])
         return resp
 
@@ -82,30 +85,30 @@ async def validate_ticket(
     if token_event_id != req.event_id:
         resp = {"status": "REJECTED", "reason_code": "WRONG_EVENT", "ticket_id": ticket_id, "decision_id": decision_id}
         if idempotency_key:
-            await set_cached_response(redis, idempotency_key, resp)
+            await set_cached_response(redis, req.event_id, idempotency_key, resp)
         await _audit(decision_id, ip, ua, req.event_id, ticket_id, resp["status"], resp["reason_code"])
         return resp
 
     # Replay protection (fast path): nonce can be seen once
-    replay_key = f"replay:{req.event_id}:{nonce}"
-    first = await redis.setnx(replay_key, "1")
-    await redis.expire(replay_key, 60 * 60 * 12)  # 12h TTL for event day
+    rkey = replay_key(req.event_id, nonce)
+    first = await redis.setnx(rkey, "1")
+    await redis.expire(rkey, 60 * 60 * 12)  # 12h TTL for event day
     if not first:
         resp = {"status": "REJECTED", "reason_code": "REPLAY", "ticket_id": ticket_id, "decision_id": decision_id}
         if idempotency_key:
-            await set_cached_response(redis, idempotency_key, resp)
+            await set_cached_response(redis, req.event_id, idempotency_key, resp)
         await _audit(decision_id, ip, ua, req.event_id, ticket_id, resp["status"], resp["reason_code"])
         return resp
 
     # Offline-like simulation: enqueue if offline
     if await is_offline_mode():
         await redis.xadd(
-            "offline_validations",
+            offline_stream_key(offline_shard(req.event_id)),
             {"decision_id": decision_id, "event_id": req.event_id, "ticket_id": ticket_id, "ip": ip, "ua": ua},
         )
         resp = {"status": "PENDING_SYNC", "reason_code": "SYSTEM_OFFLINE", "ticket_id": ticket_id, "decision_id": decision_id}
         if idempotency_key:
-            await set_cached_response(redis, idempotency_key, resp)
+            await set_cached_response(redis, req.event_id, idempotency_key, resp)
         await _audit(decision_id, ip, ua, req.event_id, ticket_id, "PENDING_SYNC", "SYSTEM_OFFLINE")
         return resp
 
@@ -116,42 +119,49 @@ async def validate_ticket(
         if not t:
             resp = {"status": "REJECTED", "reason_code": "INVALID_TOKEN", "ticket_id": ticket_id, "decision_id": decision_id}
             if idempotency_key:
-                await set_cached_response(redis, idempotency_key, resp)
+                await set_cached_response(redis, req.event_id, idempotency_key, resp)
             await _audit(decision_id, ip, ua, req.event_id, ticket_id, resp["status"], resp["reason_code"])
             return resp
 
         db.add(Redemption(ticket_id=ticket_id, event_id=req.event_id))
         db.add(AuditLog(decision_id=decision_id, ip=ip, user_agent=ua, event_id=req.event_id, ticket_id=ticket_id, status="ACCEPTED", reason_code="OK"))
         db.commit()
+        await _stats(req.event_id, ip, "ACCEPTED", "OK")
 
         resp = {"status": "ACCEPTED", "reason_code": "OK", "ticket_id": ticket_id, "decision_id": decision_id}
         if idempotency_key:
-            await set_cached_response(redis, idempotency_key, resp)
+            await set_cached_response(redis, req.event_id, idempotency_key, resp)
         return resp
 
     except IntegrityError:
         db.rollback()
         resp = {"status": "REJECTED", "reason_code": "REPLAY", "ticket_id": ticket_id, "decision_id": decision_id}
         if idempotency_key:
-            await set_cached_response(redis, idempotency_key, resp)
+            await set_cached_response(redis, req.event_id, idempotency_key, resp)
         await _audit(decision_id, ip, ua, req.event_id, ticket_id, resp["status"], resp["reason_code"])
         return resp
 
     except Exception:
         db.rollback()
         await redis.xadd(
-            "offline_validations",
+            offline_stream_key(offline_shard(req.event_id)),
             {"decision_id": decision_id, "event_id": req.event_id, "ticket_id": ticket_id, "ip": ip, "ua": ua},
         )
         resp = {"status": "PENDING_SYNC", "reason_code": "SYSTEM_OFFLINE", "ticket_id": ticket_id, "decision_id": decision_id}
         if idempotency_key:
-            await set_cached_response(redis, idempotency_key, resp)
+            await set_cached_response(redis, req.event_id, idempotency_key, resp)
         await _audit(decision_id, ip, ua, req.event_id, ticket_id, "PENDING_SYNC", "SYSTEM_OFFLINE")
         return resp
 
     finally:
         db.close()
 
+async def _stats(event_id: str, ip: str, status: str, reason: str):
+    try:
+        await record_decision(redis, event_id, status, reason, gate=ip)
+    except Exception:
+        pass
+
 async def _audit(decision_id: str, ip: str, ua: str, event_id: str, ticket_id: str | None, status: str, reason: str):
     try:
         db = SessionLocal()
@@ -164,3 +174,4 @@ async def _audit(decision_id: str, ip: str, ua: str, event_id: str, ticket_id: s
             db.close()
         except Exception:
             pass
+    await _stats(event_id, ip, status, reason)
@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, DateTime, UniqueConstraint, func
+from sqlalchemy import String, Integer, DateTime, UniqueConstraint, Index, func
 from sqlalchemy.orm import Mapped, mapped_column
 from .db import Base
 
@@ -18,7 +18,10 @@ class Redemption(Base):
     __table_args__ = (UniqueConstraint("ticket_id", "event_id", name="uniq_ticket_event"),)
 
 class AuditLog(Base):
+    # Range-partitioned by day on created_at; partitions are managed by app/retention.py.
+    # Postgres requires the partition key in the primary key.
     __tablename__ = "audit_logs"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     decision_id: Mapped[str] = mapped_column(String, index=True)
     ip: Mapped[str] = mapped_column(String)
@@ -27,7 +30,18 @@ class AuditLog(Base):
     ticket_id: Mapped[str] = mapped_column(String, index=True, nullable=True)
     status: Mapped[str] = mapped_column(String)
     reason_code: Mapped[str] = mapped_column(String)
-    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+
+class AuditRollup(Base):
+    # Per-minute decision counts, kept after raw audit partitions are archived
+    __tablename__ = "audit_rollups"
+    minute: Mapped[DateTime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    event_id: Mapped[str] = mapped_column(String, primary_key=True)
+    status: Mapped[str] = mapped_column(String, primary_key=True)
+    reason_code: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer)
+
+    __table_args__ = (Index("ix_audit_rollups_event_minute", "event_id", "minute"),)
 
 class Event(Base):
     __tablename__ = "events"
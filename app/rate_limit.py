@@ -1,8 +1,9 @@
 import time
+from .keys import rate_limit_key
 
 async def token_bucket(redis, key: str, capacity: int, refill_per_sec: float) -> bool:
     now = time.time()
-    bucket_key = f"rl:{key}"
+    bucket_key = rate_limit_key(key)
 
     # Lua would be better; keep it simple today:
     data = await redis.hgetall(bucket_key)
@@ -0,0 +1,12 @@
+import os
+from redis.asyncio import Redis
+from redis.asyncio.cluster import RedisCluster
+
+REDIS_URL = os.environ["REDIS_URL"]
+REDIS_CLUSTER = os.environ.get("REDIS_CLUSTER", "false").lower() == "true"
+
+def make_redis(decode_responses: bool):
+    """Plain Redis by default; RedisCluster when REDIS_CLUSTER=true (REDIS_URL points at any node)."""
+    if REDIS_CLUSTER:
+        return RedisCluster.from_url(REDIS_URL, decode_responses=decode_responses)
+    return Redis.from_url(REDIS_URL, decode_responses=decode_responses)
@@ -0,0 +1,300 @@
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import text, select, insert, delete, func
+
+from .models import AuditLog, AuditRollup
+
+AUDIT_RETENTION_DAYS = int(os.environ.get("AUDIT_RETENTION_DAYS", "30"))
+AUDIT_PARTITION_AHEAD_DAYS = int(os.environ.get("AUDIT_PARTITION_AHEAD_DAYS", "3"))
+AUDIT_ARCHIVE_DIR = os.environ.get("AUDIT_ARCHIVE_DIR", "archive/audit")
+
+# Minutes already rolled up are recomputed for this long, so rows landing late in a minute are counted.
+ROLLUP_LOOKBACK = timedelta(minutes=10)
+
+_PARTITION_RE = re.compile(r"^audit_logs_(\d{8})$")
+_DEFAULT_PARTITION = "audit_logs_default"
+_LEGACY_TABLE = "audit_logs_legacy"
+_MIGRATION_LOCK_ID = 0x61756469  # pg advisory lock key, "audi"
+_ROLLUP_LOCK_ID = 0x726f6c6c  # "roll"
+
+log = logging.getLogger("retention")
+
+
+def _partition_name(day: date) -> str:
+    return f"audit_logs_{day:%Y%m%d}"
+
+def _audit_relkind(conn) -> str | None:
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE relname = 'audit_logs'")).scalar()
+
+def _is_partitioned(conn) -> bool:
+    return _audit_relkind(conn) == "p"
+
+
+# -------------------------
+# Partitions
+# -------------------------
+def ensure_audit_partitions(engine, days_ahead: int = AUDIT_PARTITION_AHEAD_DAYS):
+    """
+    Create daily (UTC) partitions from yesterday up to `days_ahead`, plus a DEFAULT
+    partition so an insert never fails if maintenance falls behind.
+    """
+    with engine.connect() as conn:
+        partitioned = _is_partitioned(conn)
+    if not partitioned:
+        migrate_unpartitioned_audit_logs(engine)
+
+    today = datetime.now(timezone.utc).date()
+    _run_ddl(engine, _DEFAULT_PARTITION,
+             f"CREATE TABLE IF NOT EXISTS {_DEFAULT_PARTITION} PARTITION OF audit_logs DEFAULT")
+    for i in range(-1, days_ahead + 1):
+        day = today + timedelta(days=i)
+        try:
+            with engine.begin() as conn:
+                moved = create_audit_partition(conn, day)
+            if moved:
+                log.warning("moved %d rows from %s into %s", moved, _DEFAULT_PARTITION, _partition_name(day))
+        except Exception:
+            _log_create_failure(engine, _partition_name(day))
+
+def migrate_unpartitioned_audit_logs(engine) -> int:
+    """
+    One-time migration for databases created before audit_logs was partitioned.
+    Renames the plain table out of the way, creates the partitioned one with a daily
+    partition for every day that has rows, copies the rows over (ids preserved) and drops
+    the old table, all in one transaction. Safe to call from several processes at once.
+    Returns the number of rows migrated.
+    """
+    cols = ", ".join(c.name for c in AuditLog.__table__.columns)
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _MIGRATION_LOCK_ID})
+        if _audit_relkind(conn) != "r":
+            return 0  # already partitioned (another process got here first) or not created yet
+
+        log.warning("migrating unpartitioned audit_logs to daily partitions")
+        conn.execute(text("LOCK TABLE audit_logs IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text(f"ALTER TABLE audit_logs RENAME TO {_LEGACY_TABLE}"))
+
+        # free up index/sequence names for the new table
+        indexes = conn.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = :t"), {"t": _LEGACY_TABLE}
+        ).scalars().all()
+        for idx in indexes:
+            conn.execute(text(f'ALTER INDEX "{idx}" RENAME TO "{idx.replace("audit_logs", _LEGACY_TABLE, 1)}"'))
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS audit_logs_id_seq RENAME TO {_LEGACY_TABLE}_id_seq"))
+
+        AuditLog.__table__.create(conn)
+        conn.execute(text(f"CREATE TABLE {_DEFAULT_PARTITION} PARTITION OF audit_logs DEFAULT"))
+
+        first, last = conn.execute(text(
+            f"SELECT min(created_at AT TIME ZONE 'UTC')::date, max(created_at AT TIME ZONE 'UTC')::date FROM {_LEGACY_TABLE}"
+        )).one()
+        if first is not None:
+            day = first
+            while day <= last:
+                create_audit_partition(conn, day)
+                day += timedelta(days=1)
+
+        n = conn.execute(text(f"INSERT INTO audit_logs ({cols}) SELECT {cols} FROM {_LEGACY_TABLE}")).rowcount
+        conn.execute(text("SELECT setval('audit_logs_id_seq', (SELECT coalesce(max(id), 0) + 1 FROM audit_logs), false)"))
+        conn.execute(text(f"DROP TABLE {_LEGACY_TABLE}"))
+
+    log.warning("migrated %d audit_logs rows into daily partitions", n)
+    return n
+
+def _table_exists(conn, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:n) IS NOT NULL"), {"n": name}).scalar()
+
+def _log_create_failure(engine, name: str):
+    # API and worker both run this at startup; losing the race to create a partition is fine
+    with engine.connect() as conn:
+        if _table_exists(conn, name):
+            return
+    log.exception("failed to create audit partition %s", name)
+
+def _run_ddl(engine, name: str, stmt: str):
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(stmt))
+    except Exception:
+        _log_create_failure(engine, name)
+
+def create_audit_partition(conn, day: date) -> int:
+    """
+    Create the partition for `day` on `conn` (caller owns the transaction).
+    Postgres won't create a range partition while the DEFAULT partition holds rows in that
+    range, so those rows are moved over: detach default, create, move, re-attach.
+    Returns the number of rows moved.
+    """
+    name = _partition_name(day)
+    if _table_exists(conn, name):
+        return 0
+
+    lo = f"{day.isoformat()} 00:00:00+00"
+    hi = f"{(day + timedelta(days=1)).isoformat()} 00:00:00+00"
+    create = f"CREATE TABLE {name} PARTITION OF audit_logs FOR VALUES FROM ('{lo}') TO ('{hi}')"
+
+    stranded = 0
+    if _table_exists(conn, _DEFAULT_PARTITION):
+        stranded = conn.execute(
+            text(f"SELECT count(*) FROM {_DEFAULT_PARTITION} WHERE created_at >= :lo AND created_at < :hi"),
+            {"lo": lo, "hi": hi},
+        ).scalar()
+    if not stranded:
+        conn.execute(text(create))
+        return 0
+
+    cols = ", ".join(c.name for c in AuditLog.__table__.columns)
+    conn.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {_DEFAULT_PARTITION}"))
+    conn.execute(text(create))
+    conn.execute(
+        text(f"INSERT INTO {name} ({cols}) SELECT {cols} FROM {_DEFAULT_PARTITION} "
+             "WHERE created_at >= :lo AND created_at < :hi"),
+        {"lo": lo, "hi": hi},
+    )
+    conn.execute(
+        text(f"DELETE FROM {_DEFAULT_PARTITION} WHERE created_at >= :lo AND created_at < :hi"),
+        {"lo": lo, "hi": hi},
+    )
+    conn.execute(text(f"ALTER TABLE audit_logs ATTACH PARTITION {_DEFAULT_PARTITION} DEFAULT"))
+    return stranded
+
+def list_audit_partitions(engine) -> list[tuple[str, date]]:
+    with engine.connect() as conn:
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'audit_logs'"
+        )).scalars().all()
+
+    out = []
+    for name in names:
+        m = _PARTITION_RE.match(name)
+        if m:
+            out.append((name, datetime.strptime(m.group(1), "%Y%m%d").date()))
+    return sorted(out, key=lambda x: x[1])
+
+
+# -------------------------
+# Rollups
+# -------------------------
+def rollup_watermark(db):
+    """Start of the first minute not yet rolled up (None if nothing has been)."""
+    last = db.execute(select(func.max(AuditRollup.minute))).scalar()
+    return last + timedelta(minutes=1) if last else None
+
+def rollup_audit(db, until: datetime | None = None) -> datetime:
+    """
+    Recompute per-minute counts by event/status/reason for every closed minute since
+    the last run (minus a small lookback), up to but excluding `until`.
+    """
+    until = until or datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+    # Serialize runs (worker replicas, tests): overlapping delete-then-insert would otherwise
+    # hit the audit_rollups PK. Held until commit; the watermark is read after acquiring it.
+    db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _ROLLUP_LOCK_ID})
+    since = rollup_watermark(db)
+    if since is not None:
+        since = min(since, until - ROLLUP_LOOKBACK)
+
+    minute = func.date_trunc("minute", AuditLog.created_at)
+    q = (
+        select(minute, AuditLog.event_id, AuditLog.status, AuditLog.reason_code, func.count())
+        .where(AuditLog.created_at < until)
+        .group_by(minute, AuditLog.event_id, AuditLog.status, AuditLog.reason_code)
+    )
+    d = delete(AuditRollup).where(AuditRollup.minute < until)
+    if since is not None:
+        q = q.where(AuditLog.created_at >= since)
+        d = d.where(AuditRollup.minute >= since)
+
+    db.execute(d)
+    db.execute(
+        insert(AuditRollup).from_select(["minute", "event_id", "status", "reason_code", "count"], q)
+    )
+    db.commit()
+    return until
+
+
+# -------------------------
+# Retention
+# -------------------------
+def _archive_rows(engine, table: str, path: str, where: str = "", params: dict | None = None) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+
+    cols = [c.name for c in AuditLog.__table__.columns]
+    with engine.connect() as conn, gzip.open(tmp, "wt", encoding="utf-8") as f:
+        result = conn.execution_options(stream_results=True).execute(
+            text(f"SELECT {', '.join(cols)} FROM {table} {where} ORDER BY created_at"), params or {}
+        )
+        for row in result:
+            rec = dict(zip(cols, row))
+            rec["created_at"] = str(rec["created_at"])
+            f.write(json.dumps(rec) + "\n")
+
+    os.replace(tmp, path)
+    return path
+
+def purge_default_rows(engine, until: date, archive_dir: str | None, since: date | None = None) -> int:
+    """Archive and delete rows in [since, until) that ended up in the DEFAULT partition."""
+    with engine.connect() as conn:
+        if not _table_exists(conn, _DEFAULT_PARTITION):
+            return 0
+    where, params = "WHERE created_at < :until", {"until": f"{until.isoformat()} 00:00:00+00"}
+    label = f"before_{until:%Y%m%d}"
+    if since is not None:
+        where += " AND created_at >= :since"
+        params["since"] = f"{since.isoformat()} 00:00:00+00"
+        label = f"{since:%Y%m%d}_{until:%Y%m%d}"
+
+    with engine.connect() as conn:
+        n = conn.execute(text(f"SELECT count(*) FROM {_DEFAULT_PARTITION} {where}"), params).scalar()
+    if not n:
+        return 0
+
+    if archive_dir:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = _archive_rows(engine, _DEFAULT_PARTITION,
+                             os.path.join(archive_dir, f"{_DEFAULT_PARTITION}_{label}_{stamp}.jsonl.gz"),
+                             where, params)
+        log.info("archived %d rows from %s -> %s", n, _DEFAULT_PARTITION, path)
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {_DEFAULT_PARTITION} {where}"), params)
+    return n
+
+def archive_and_drop_partition(engine, name: str, archive_dir: str | None):
+    """Archive one daily partition to gzipped JSONL (unless archive_dir is None), then drop it."""
+    if archive_dir:
+        path = _archive_rows(engine, name, os.path.join(archive_dir, f"{name}.jsonl.gz"))
+        log.info("archived %s -> %s", name, path)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+
+def drop_old_partitions(engine, retention_days: int = AUDIT_RETENTION_DAYS, archive_dir: str | None = AUDIT_ARCHIVE_DIR):
+    """
+    Archive (gzipped JSONL) and drop daily partitions older than `retention_days`, and purge
+    rows that old from the DEFAULT partition. Pass archive_dir=None to drop without archiving.
+    Rollups must already cover them.
+    """
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=retention_days)
+    dropped = []
+    for name, day in list_audit_partitions(engine):
+        if day >= cutoff:
+            continue
+        archive_and_drop_partition(engine, name, archive_dir)
+        dropped.append(name)
+
+    purge_default_rows(engine, cutoff, archive_dir)
+    return dropped
+
+def run_audit_maintenance(engine, db):
+    ensure_audit_partitions(engine)
+    rollup_audit(db)
+    return drop_old_partitions(engine)
@@ -0,0 +1,252 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, func, or_
+from sqlalchemy.orm import aliased
+
+from .models import Ticket, Event, Redemption, AuditLog, AuditRollup
+from .retention import rollup_watermark
+from .keys import stats_key, stats_bucket_key
+
+# Per-event counters live in one hash; per-minute activity lives in short-lived bucket hashes.
+BUCKET_SECONDS = 60
+BUCKET_TTL_SECONDS = 60 * 60 * 6
+
+SYNC_REASONS = ("OK_SYNCED", "REPLAY_ON_SYNC")
+
+# Counters are only touched if the event hash exists (created with the event or by a rebuild),
+# so spam against made-up event_ids can't create keys.
+_RECORD_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+local status, reason, gate, synced = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+if synced == '1' then
+  redis.call('HINCRBY', KEYS[1], 'pending_sync', -1)
+else
+  redis.call('HINCRBY', KEYS[1], 'decisions', 1)
+  redis.call('HINCRBY', KEYS[2], 'decisions', 1)
+  redis.call('HINCRBY', KEYS[2], 'gate:' .. gate, 1)
+end
+if status == 'ACCEPTED' then
+  redis.call('HINCRBY', KEYS[1], 'redeemed', 1)
+  redis.call('HINCRBY', KEYS[2], 'accepted', 1)
+elseif status == 'PENDING_SYNC' then
+  redis.call('HINCRBY', KEYS[1], 'pending_sync', 1)
+  redis.call('HINCRBY', KEYS[2], 'pending_sync', 1)
+elseif status == 'REJECTED' then
+  redis.call('HINCRBY', KEYS[1], 'rejected:' .. reason, 1)
+  redis.call('HINCRBY', KEYS[2], 'rejected:' .. reason, 1)
+end
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return 1
+"""
+
+# Swap in rebuilt totals without a window where the hash is missing (MULTI isn't available on cluster pipelines).
+_REPLACE_LUA = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+# Script objects per client, registered on first use. Keyed by id(); each Script holds its
+# client, so the id can't be reused while the entry exists.
+_scripts: dict[int, dict] = {}
+
+def _script(redis, name: str):
+    scripts = _scripts.get(id(redis))
+    if scripts is None:
+        scripts = _scripts[id(redis)] = {
+            "record": redis.register_script(_RECORD_LUA),
+            "replace": redis.register_script(_REPLACE_LUA),
+        }
+    return scripts[name]
+
+def _bucket(ts: float) -> int:
+    return int(ts) // BUCKET_SECONDS * BUCKET_SECONDS
+
+def _s(v) -> str:
+    # main.py's client returns bytes, admin/worker return str
+    return v.decode("utf-8") if isinstance(v, bytes) else v
+
+
+async def set_issued(redis, event_id: str, count: int):
+    await redis.hset(stats_key(event_id), "issued", count)
+
+async def record_decision(redis, event_id: str, status: str, reason_code: str, gate: str = "unknown", synced: bool = False):
+    """Apply one gate decision to the event's counters in a single atomic script call."""
+    bucket = _bucket(time.time())
+    await _script(redis, "record")(
+        keys=[stats_key(event_id), stats_bucket_key(event_id, bucket)],
+        args=[status, reason_code, gate, "1" if synced else "0", BUCKET_TTL_SECONDS],
+    )
+
+
+def _split_bucket(raw: dict) -> dict:
+    out = {"decisions": 0, "accepted": 0, "pending_sync": 0, "rejected": {}, "gates": {}}
+    for k, v in raw.items():
+        k, v = _s(k), int(v)
+        if k.startswith("rejected:"):
+            out["rejected"][k[len("rejected:"):]] = v
+        elif k.startswith("gate:"):
+            out["gates"][k[len("gate:"):]] = v
+        elif k in out:
+            out[k] = v
+    return out
+
+async def get_stats(redis, event_id: str, minutes: int = 15) -> dict | None:
+    raw = await redis.hgetall(stats_key(event_id))
+    if not raw:
+        return None
+
+    totals = {"issued": 0, "redeemed": 0, "pending_sync": 0, "decisions": 0, "rejected": {}}
+    for k, v in raw.items():
+        k, v = _s(k), int(v)
+        if k.startswith("rejected:"):
+            totals["rejected"][k[len("rejected:"):]] = v
+        elif k in totals:
+            totals[k] = v
+
+    minutes = max(0, min(minutes, BUCKET_TTL_SECONDS // BUCKET_SECONDS))
+    current = _bucket(time.time())
+    starts = [current - i * BUCKET_SECONDS for i in range(minutes)]
+
+    pipe = redis.pipeline(transaction=False)
+    for start in starts:
+        pipe.hgetall(stats_bucket_key(event_id, start))
+    rows = await pipe.execute()
+
+    buckets = []
+    for start, row in zip(starts, rows):
+        b = _split_bucket(row or {})
+        b["start"] = datetime.fromtimestamp(start, timezone.utc).isoformat()
+        buckets.append(b)
+
+    return {"event_id": event_id, **totals, "buckets": buckets}
+
+
+# -------------------------
+# Rebuild from Postgres
+# -------------------------
+def _load_from_db(db, event_id: str, since: datetime, until: datetime):
+    issued = db.execute(select(func.count()).select_from(Ticket).where(Ticket.event_id == event_id)).scalar_one()
+    redeemed = db.execute(select(func.count()).select_from(Redemption).where(Redemption.event_id == event_id)).scalar_one()
+
+    # Closed minutes come from the rollups (raw rows may already be archived), the rest from audit_logs.
+    counts: dict[tuple[str, str], int] = {}
+    watermark = rollup_watermark(db)
+    raw = (
+        select(AuditLog.status, AuditLog.reason_code, func.count())
+        .where(AuditLog.event_id == event_id)
+        .group_by(AuditLog.status, AuditLog.reason_code)
+    )
+    if watermark is not None:
+        raw = raw.where(AuditLog.created_at >= watermark)
+        rolled = db.execute(
+            select(AuditRollup.status, AuditRollup.reason_code, func.sum(AuditRollup.count))
+            .where(AuditRollup.event_id == event_id, AuditRollup.minute < watermark)
+            .group_by(AuditRollup.status, AuditRollup.reason_code)
+        ).all()
+        for status, reason, n in rolled:
+            counts[(status, reason)] = counts.get((status, reason), 0) + int(n)
+    for status, reason, n in db.execute(raw).all():
+        counts[(status, reason)] = counts.get((status, reason), 0) + n
+
+    decisions = sum(n for (_, reason), n in counts.items() if reason not in SYNC_REASONS)
+
+    # A PENDING_SYNC decision stays pending until the worker writes its sync result.
+    synced = aliased(AuditLog)
+    pending = db.execute(
+        select(func.count()).select_from(AuditLog)
+        .where(
+            AuditLog.event_id == event_id,
+            AuditLog.status == "PENDING_SYNC",
+            ~select(synced.id).where(
+                synced.decision_id == AuditLog.decision_id,
+                synced.reason_code.in_(SYNC_REASONS),
+            ).exists(),
+        )
+    ).scalar_one()
+
+    minute = func.date_trunc("minute", AuditLog.created_at)
+    bucket_rows = db.execute(
+        select(minute, AuditLog.status, AuditLog.reason_code, AuditLog.ip, func.count())
+        .where(AuditLog.event_id == event_id, AuditLog.created_at >= since, AuditLog.created_at < until)
+        .group_by(minute, AuditLog.status, AuditLog.reason_code, AuditLog.ip)
+    ).all()
+
+    totals = {"issued": issued, "redeemed": redeemed, "pending_sync": pending, "decisions": decisions}
+    for (status, reason), n in counts.items():
+        if status == "REJECTED":
+            totals[f"rejected:{reason}"] = totals.get(f"rejected:{reason}", 0) + n
+
+    buckets: dict[int, dict] = {}
+    for ts, status, reason, ip, n in bucket_rows:
+        b = buckets.setdefault(_bucket(ts.timestamp()), {})
+        if reason not in SYNC_REASONS:
+            b["decisions"] = b.get("decisions", 0) + n
+            b[f"gate:{ip}"] = b.get(f"gate:{ip}", 0) + n
+        if status == "ACCEPTED":
+            field = "accepted"
+        elif status == "PENDING_SYNC":
+            field = "pending_sync"
+        else:
+            field = f"rejected:{reason}"
+        b[field] = b.get(field, 0) + n
+
+    return totals, buckets
+
+async def rebuild_stats(redis, db, event_id: str):
+    """
+    Recompute one event's counters from Postgres and overwrite what's in Redis.
+    The in-progress minute is left alone so live increments for it aren't lost.
+
+    The totals are a snapshot taken before the replace, so decisions landing in between
+    can drift by a count: one whose Redis increment happens after the DB read is
+    overwritten (lost), one whose audit row was read but whose increment lands after the
+    replace is counted twice. The next rebuild pass corrects either.
+    """
+    now = time.time()
+    current = _bucket(now)
+    since = datetime.fromtimestamp(current - BUCKET_TTL_SECONDS, timezone.utc)
+    until = datetime.fromtimestamp(current, timezone.utc)
+
+    # Blocking SQLAlchemy work runs off the event loop so the worker's stream loops keep going.
+    totals, buckets = await asyncio.to_thread(_load_from_db, db, event_id, since, until)
+
+    fields = []
+    for k, v in totals.items():
+        fields += [k, v]
+    await _script(redis, "replace")(keys=[stats_key(event_id)], args=fields)
+
+    # Closed buckets only; record_decision never writes to these, so no atomicity needed.
+    pipe = redis.pipeline(transaction=False)
+    for start, bucket_fields in buckets.items():
+        ttl = int(start + BUCKET_TTL_SECONDS - now)
+        if ttl <= 0:
+            continue
+        pipe.delete(stats_bucket_key(event_id, start))
+        pipe.hset(stats_bucket_key(event_id, start), mapping=bucket_fields)
+        pipe.expire(stats_bucket_key(event_id, start), ttl)
+    await pipe.execute()
+
+def _active_event_ids(db, since: datetime) -> list[str]:
+    # Events created, or with any gate/sync decision, since `since`. Bogus event_ids from
+    # spam have audit rows but no Event row, so they're filtered out by the IN.
+    recent = select(AuditLog.event_id).where(AuditLog.created_at >= since).distinct()
+    return db.execute(
+        select(Event.id).where(or_(Event.created_at >= since, Event.id.in_(recent)))
+    ).scalars().all()
+
+async def rebuild_all_stats(redis, db, active_within: timedelta | None = timedelta(seconds=BUCKET_TTL_SECONDS)):
+    """
+    Rebuild every event with activity in the last `active_within` (the bucket window by
+    default); idle events' counters don't move. Pass None to rebuild every event.
+    """
+    if active_within is None:
+        event_ids = await asyncio.to_thread(lambda: db.execute(select(Event.id)).scalars().all())
+    else:
+        since = datetime.now(timezone.utc) - active_within
+        event_ids = await asyncio.to_thread(_active_event_ids, db, since)
+    for event_id in event_ids:
+        await rebuild_stats(redis, db, event_id)
+    return len(event_ids)
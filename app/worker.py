@@ -1,28 +1,74 @@
 import os
 import asyncio
-from redis.asyncio import Redis
+import logging
 from sqlalchemy.exc import IntegrityError
 from .db import SessionLocal, engine, Base
 from .models import Redemption, AuditLog
+from .stats import record_decision, rebuild_all_stats
+from .retention import ensure_audit_partitions, run_audit_maintenance
+from .keys import (
+    OFFLINE_STREAM_SHARDS, offline_stream_key, worker_last_id_key,
+    LEGACY_OFFLINE_STREAM, LEGACY_WORKER_LAST_ID,
+)
+from .redis_client import make_redis
 
 Base.metadata.create_all(bind=engine)
+ensure_audit_partitions(engine)
 
-redis = Redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+redis = make_redis(decode_responses=True)
+
+STATS_REBUILD_SECONDS = float(os.environ.get("STATS_REBUILD_SECONDS", "300"))
+AUDIT_MAINTENANCE_SECONDS = float(os.environ.get("AUDIT_MAINTENANCE_SECONDS", "60"))
 
 async def offline_enabled() -> bool:
     val = await redis.get("cfg:offline_mode")
     return (val or "false").lower() == "true"
 
-async def main():
+async def stats_rebuild_loop():
+    # live counters are updated per decision; this periodically re-derives them from Postgres.
+    # First pass covers every event (e.g. Redis was wiped while idle), later ones only active events.
+    full = True
+    while True:
+        db = SessionLocal()
+        try:
+            n = await rebuild_all_stats(redis, db, active_within=None) if full else await rebuild_all_stats(redis, db)
+            full = False
+            print(f"[worker] rebuilt stats for {n} events")
+        except Exception as e:
+            print(f"[worker] stats rebuild failed: {e!r}")
+        finally:
+            db.close()
+        await asyncio.sleep(STATS_REBUILD_SECONDS)
+
+async def audit_maintenance_loop():
+    # premake partitions, roll up closed minutes, archive + drop partitions past retention
+    while True:
+        db = SessionLocal()
+        try:
+            # rollup INSERT...SELECT and gzipping partitions block; keep them off the event loop
+            dropped = await asyncio.to_thread(run_audit_maintenance, engine, db)
+            if dropped:
+                print(f"[worker] dropped audit partitions {dropped}")
+        except Exception as e:
+            print(f"[worker] audit maintenance failed: {e!r}")
+        finally:
+            db.close()
+        await asyncio.sleep(AUDIT_MAINTENANCE_SECONDS)
+
+async def drain_shard(shard: int):
+    # One loop per offline stream shard; in cluster mode each stream may sit on a different node.
+    stream = offline_stream_key(shard)
+    progress_key = worker_last_id_key(shard)
+
     # resume where we left off (so backlog gets processed after offline)
-    last_id = await redis.get("worker:last_id") or "0-0"
+    last_id = await redis.get(progress_key) or "0-0"
 
     while True:
         if await offline_enabled():
             await asyncio.sleep(1.0)
             continue
 
-        resp = await redis.xread({"offline_validations": last_id}, block=5000, count=50)
+        resp = await redis.xread({stream: last_id}, block=5000, count=50)
         if not resp:
             continue
 
@@ -30,10 +76,45 @@ async def main():
         for msg_id, data in messages:
             last_id = msg_id
             await process_one(data)
-            await redis.xdel("offline_validations", msg_id)
+            await redis.xdel(stream, msg_id)
 
             # persist progress
-            await redis.set("worker:last_id", last_id)
+            await redis.set(progress_key, last_id)
+
+async def drain_legacy_stream():
+    # Scans queued in the single pre-sharding stream before an upgrade still need syncing.
+    if not await redis.exists(LEGACY_OFFLINE_STREAM):
+        return
+
+    last_id = await redis.get(LEGACY_WORKER_LAST_ID) or "0-0"
+    while True:
+        if await offline_enabled():
+            await asyncio.sleep(1.0)
+            continue
+
+        resp = await redis.xread({LEGACY_OFFLINE_STREAM: last_id}, count=50)
+        if not resp:
+            break
+
+        _, messages = resp[0]
+        for msg_id, data in messages:
+            last_id = msg_id
+            await process_one(data)
+            await redis.xdel(LEGACY_OFFLINE_STREAM, msg_id)
+            await redis.set(LEGACY_WORKER_LAST_ID, last_id)
+
+    print(f"[worker] legacy stream {LEGACY_OFFLINE_STREAM} drained")
+    if await redis.xlen(LEGACY_OFFLINE_STREAM) == 0:
+        await redis.delete(LEGACY_OFFLINE_STREAM)
+        await redis.delete(LEGACY_WORKER_LAST_ID)
+
+async def main():
+    await asyncio.gather(
+        audit_maintenance_loop(),
+        stats_rebuild_loop(),
+        drain_legacy_stream(),
+        *(drain_shard(shard) for shard in range(OFFLINE_STREAM_SHARDS)),
+    )
 
 
 async def process_one(data: dict):
@@ -59,6 +140,7 @@ async def process_one(data: dict):
             reason_code="OK_SYNCED",
         ))
         db.commit()
+        status, reason = "ACCEPTED", "OK_SYNCED"
     except IntegrityError:
         db.rollback()
         # Optional: helpful demo logs
@@ -74,8 +156,18 @@ async def process_one(data: dict):
             reason_code="REPLAY_ON_SYNC",
         ))
         db.commit()
+        status, reason = "REJECTED", "REPLAY_ON_SYNC"
     finally:
         db.close()
 
+    # Best-effort like main.py: the sync result is already committed, so a stats failure
+    # must not stop xdel/progress or the message would be replayed as REPLAY_ON_SYNC.
+    try:
+        await record_decision(redis, event_id, status, reason, gate=ip, synced=True)
+    except Exception as e:
+        print(f"[worker] stats update failed decision_id={decision_id}: {e!r}")
+
 if __name__ == "__main__":
+    # surfaces app.retention's archive/partition logs in the worker output
+    logging.basicConfig(level=logging.INFO, format="[%(name)s] %(levelname)s %(message)s")
     asyncio.run(main())
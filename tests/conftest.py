@@ -2,19 +2,35 @@ import os
 import pytest_asyncio
 import httpx
 from redis.asyncio import Redis
+from redis.asyncio.cluster import RedisCluster
 
 BASE_URL = os.getenv("BASE_URL", "http://127.0.0.1:8000")
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() == "true"
+
+def make_redis():
+    if REDIS_CLUSTER:
+        return RedisCluster.from_url(REDIS_URL, decode_responses=True)
+    return Redis.from_url(REDIS_URL, decode_responses=True)
 
 @pytest_asyncio.fixture(scope="function")
 async def client():
     async with httpx.AsyncClient(base_url=BASE_URL, timeout=10.0) as c:
         yield c
 
+@pytest_asyncio.fixture(scope="function")
+async def redis():
+    r = make_redis()
+    try:
+        yield r
+    finally:
+        await r.aclose()
+
 @pytest_asyncio.fixture(autouse=True, scope="function")
 async def clean_redis():
-    r = Redis.from_url(REDIS_URL, decode_responses=True)
+    r = make_redis()
     try:
+        # on a cluster FLUSHDB is sent to every primary
         await r.flushdb()
         await r.set("cfg:offline_mode", "false")
         yield
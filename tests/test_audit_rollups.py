@@ -0,0 +1,153 @@
+import glob
+import gzip
+import json
+import os
+import random
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, text
+
+from app.db import SessionLocal, engine
+from app.models import AuditLog, AuditRollup
+from app.retention import rollup_audit, create_audit_partition, archive_and_drop_partition, purge_default_rows
+
+pytestmark = pytest.mark.asyncio
+
+def _insert(db, event_id, at, status, reason, n=1):
+    ids = []
+    for i in range(n):
+        decision_id = str(uuid.uuid4())
+        db.add(AuditLog(
+            decision_id=decision_id, ip="10.0.0.1", user_agent="pytest", event_id=event_id,
+            ticket_id=None, status=status, reason_code=reason, created_at=at + timedelta(seconds=i),
+        ))
+        ids.append(decision_id)
+    db.commit()
+    return ids
+
+def _rollups(db, event_id, until):
+    # the worker may roll up later minutes concurrently; only look at the closed ones
+    rows = db.execute(
+        select(AuditRollup.minute, AuditRollup.status, AuditRollup.reason_code, AuditRollup.count)
+        .where(AuditRollup.event_id == event_id, AuditRollup.minute < until)
+    ).all()
+    return {(m, s, r): c for (m, s, r, c) in rows}
+
+def _test_day():
+    # Far-future day: the live worker only creates partitions a few days ahead and only
+    # ages out the past, so it never touches these; real partitions are never touched either.
+    while True:
+        day = date.today() + timedelta(days=random.randint(1000, 20000))
+        if not _exists(f"audit_logs_{day:%Y%m%d}"):
+            return day
+
+def _at(day, hour):
+    return datetime(day.year, day.month, day.day, hour, tzinfo=timezone.utc)
+
+def _exists(name):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT to_regclass(:n) IS NOT NULL"), {"n": name}).scalar()
+
+async def test_rollup_counts_per_minute_and_rerun_is_idempotent():
+    event_id = f"evt_rollup_{uuid.uuid4().hex[:8]}"
+    m1 = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(minutes=5)
+    m2 = m1 + timedelta(minutes=1)
+    until = m2 + timedelta(minutes=1)
+
+    db = SessionLocal()
+    try:
+        _insert(db, event_id, m1, "ACCEPTED", "OK", n=2)
+        _insert(db, event_id, m1, "REJECTED", "REPLAY", n=1)
+        _insert(db, event_id, m2, "REJECTED", "RATE_LIMITED", n=3)
+        # open minute: not rolled up yet
+        _insert(db, event_id, until, "REJECTED", "RATE_LIMITED", n=1)
+
+        expected = {
+            (m1, "ACCEPTED", "OK"): 2,
+            (m1, "REJECTED", "REPLAY"): 1,
+            (m2, "REJECTED", "RATE_LIMITED"): 3,
+        }
+        rollup_audit(db, until=until)
+        assert _rollups(db, event_id, until) == expected
+
+        # rerun inside ROLLUP_LOOKBACK recomputes rather than adding
+        rollup_audit(db, until=until)
+        assert _rollups(db, event_id, until) == expected
+
+        # a late row in an already rolled-up minute is picked up on the next run
+        _insert(db, event_id, m2 + timedelta(seconds=30), "REJECTED", "RATE_LIMITED", n=1)
+        rollup_audit(db, until=until)
+        assert _rollups(db, event_id, until)[(m2, "REJECTED", "RATE_LIMITED")] == 4
+    finally:
+        db.close()
+
+async def test_partition_create_moves_rows_out_of_default(tmp_path):
+    day = _test_day()
+    name = f"audit_logs_{day:%Y%m%d}"
+
+    db = SessionLocal()
+    try:
+        # no partition for that day yet, so these land in audit_logs_default
+        ids = _insert(db, "evt_stranded", _at(day, 12), "REJECTED", "RATE_LIMITED", n=2)
+    finally:
+        db.close()
+
+    with engine.begin() as conn:
+        assert create_audit_partition(conn, day) == 2
+
+    try:
+        with engine.connect() as conn:
+            moved = conn.execute(text(f"SELECT decision_id FROM {name}")).scalars().all()
+            left = conn.execute(
+                text("SELECT count(*) FROM audit_logs_default WHERE decision_id = ANY(:ids)"), {"ids": ids}
+            ).scalar()
+        assert sorted(moved) == sorted(ids)
+        assert left == 0
+    finally:
+        archive_and_drop_partition(engine, name, archive_dir=None)
+    assert not _exists(name)
+
+async def test_archive_and_drop_partition(tmp_path):
+    day = _test_day()
+    name = f"audit_logs_{day:%Y%m%d}"
+    with engine.begin() as conn:
+        create_audit_partition(conn, day)
+    assert _exists(name)
+
+    db = SessionLocal()
+    try:
+        ids = _insert(db, "evt_old", _at(day, 9), "ACCEPTED", "OK", n=3)
+    finally:
+        db.close()
+
+    archive_and_drop_partition(engine, name, archive_dir=str(tmp_path))
+    assert not _exists(name)
+
+    with gzip.open(os.path.join(tmp_path, f"{name}.jsonl.gz"), "rt", encoding="utf-8") as f:
+        recs = [json.loads(line) for line in f]
+    assert sorted(r["decision_id"] for r in recs) == sorted(ids)
+    assert all(r["event_id"] == "evt_old" and r["reason_code"] == "OK" for r in recs)
+
+async def test_purge_default_rows_archives_and_deletes(tmp_path):
+    day = _test_day()
+
+    db = SessionLocal()
+    try:
+        # no partition for that day: goes to the default partition
+        ids = _insert(db, "evt_old", _at(day, 9), "REJECTED", "REPLAY", n=2)
+    finally:
+        db.close()
+
+    assert purge_default_rows(engine, day + timedelta(days=1), str(tmp_path), since=day) == 2
+
+    (archive,) = glob.glob(os.path.join(tmp_path, "audit_logs_default_*.jsonl.gz"))
+    with gzip.open(archive, "rt", encoding="utf-8") as f:
+        assert sorted(json.loads(line)["decision_id"] for line in f) == sorted(ids)
+
+    with engine.connect() as conn:
+        remaining = conn.execute(
+            text("SELECT count(*) FROM audit_logs WHERE decision_id = ANY(:ids)"), {"ids": ids}
+        ).scalar()
+    assert remaining == 0
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from tests.helpers import create_event, list_tickets
+
+pytestmark = pytest.mark.asyncio
+
+async def test_stats_count_redeemed_and_rejected(client):
+    event_id = await create_event(client, name="Stats Event", ticket_count=3)
+    tickets = await list_tickets(client, event_id)
+    ticket_id = tickets[0]["ticket_id"]
+
+    r1 = (await client.post("/admin/scan", json={"event_id": event_id, "ticket_id": ticket_id, "org_id": "org_1"})).json()
+    assert r1["status"] == "ACCEPTED"
+    r2 = (await client.post("/admin/scan", json={"event_id": event_id, "ticket_id": ticket_id, "org_id": "org_1"})).json()
+    assert r2["status"] == "REJECTED"
+
+    stats = (await client.get(f"/admin/events/{event_id}/stats", params={"minutes": 5})).json()
+    assert stats["issued"] == 3
+    assert stats["redeemed"] == 1
+    assert stats["decisions"] == 2
+    assert stats["rejected"].get(r2["reason_code"]) == 1
+
+    assert len(stats["buckets"]) == 5
+    assert sum(b["decisions"] for b in stats["buckets"]) == 2
+
+async def test_stats_unknown_event(client):
+    r = (await client.get("/admin/events/evt_doesnotexist/stats")).json()
+    assert r.get("ok") is False
+
+async def test_stats_pending_sync_drains_through_worker(client):
+    event_id = await create_event(client, name="Stats Pending Event", ticket_count=2)
+    tickets = await list_tickets(client, event_id)
+
+    await client.post("/admin/offline", json={"enabled": True})
+    r = (await client.post("/admin/scan", json={"event_id": event_id, "ticket_id": tickets[0]["ticket_id"], "org_id": "org_1"})).json()
+    assert r["status"] == "PENDING_SYNC"
+
+    stats = (await client.get(f"/admin/events/{event_id}/stats")).json()
+    assert stats["pending_sync"] == 1
+    assert stats["redeemed"] == 0
+
+    await client.post("/admin/offline", json={"enabled": False})
+
+    for _ in range(30):
+        stats = (await client.get(f"/admin/events/{event_id}/stats")).json()
+        if stats["pending_sync"] == 0:
+            assert stats["redeemed"] == 1
+            assert stats["decisions"] == 1
+            return
+        await asyncio.sleep(1.0)
+
+    assert False, f"pending_sync never drained: {stats}"
+
+async def test_rebuild_restores_deleted_counters(client, redis):
+    from app.db import SessionLocal
+    from app.keys import stats_key
+    from app.stats import rebuild_stats
+
+    event_id = await create_event(client, name="Stats Rebuild Event", ticket_count=4)
+    tickets = await list_tickets(client, event_id)
+    ticket_id = tickets[0]["ticket_id"]
+
+    await client.post("/admin/scan", json={"event_id": event_id, "ticket_id": ticket_id, "org_id": "org_1"})
+    await client.post("/admin/scan", json={"event_id": event_id, "ticket_id": ticket_id, "org_id": "org_1"})
+    before = (await client.get(f"/admin/events/{event_id}/stats")).json()
+
+    await redis.delete(stats_key(event_id))
+    gone = (await client.get(f"/admin/events/{event_id}/stats")).json()
+    assert gone.get("ok") is False
+
+    db = SessionLocal()
+    try:
+        await rebuild_stats(redis, db, event_id)
+    finally:
+        db.close()
+
+    after = (await client.get(f"/admin/events/{event_id}/stats")).json()
+    for field in ("issued", "redeemed", "pending_sync", "decisions", "rejected"):
+        assert after[field] == before[field], field
+    assert after["issued"] == 4
+    assert after["redeemed"] == 1
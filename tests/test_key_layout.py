@@ -0,0 +1,73 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from jose import jwt
+from redis.crc import key_slot
+
+from app.keys import (
+    OFFLINE_STREAM_SHARDS, LEGACY_OFFLINE_STREAM,
+    idem_key, replay_key, stats_key, stats_bucket_key, offline_stream_key, offline_shard,
+)
+from tests.helpers import create_event, list_tickets
+
+pytestmark = pytest.mark.asyncio
+
+SECRET = os.environ.get("TICKET_SIGNING_SECRET", "dev_secret_change_me")
+
+async def test_event_keys_share_hash_tag(client, redis):
+    event_id = await create_event(client, name="Key Layout Event", ticket_count=2)
+    tickets = await list_tickets(client, event_id)
+
+    nonce = str(uuid.uuid4())
+    exp = int((datetime.now(timezone.utc) + timedelta(minutes=5)).timestamp())
+    token = jwt.encode(
+        {"ticket_id": tickets[0]["ticket_id"], "event_id": event_id, "org_id": "org_1", "nonce": nonce, "exp": exp},
+        SECRET, algorithm="HS256",
+    )
+    r = (await client.post("/validate", json={"qr_token": token, "event_id": event_id}, headers={"Idempotency-Key": "layout-1"})).json()
+    assert r["status"] == "ACCEPTED"
+
+    # the decision landed in this minute's bucket, or the previous one if the minute just rolled over
+    minute = int(time.time()) // 60 * 60
+    bucket = None
+    for start in (minute, minute - 60):
+        if await redis.exists(stats_bucket_key(event_id, start)):
+            bucket = stats_bucket_key(event_id, start)
+            break
+    keys = [stats_key(event_id), idem_key(event_id, "layout-1"), replay_key(event_id, nonce), bucket]
+    for k in keys:
+        assert k and await redis.exists(k), k
+        assert "{" + event_id + "}" in k
+
+    slots = {key_slot(k.encode()) for k in keys}
+    assert len(slots) == 1, slots
+
+async def test_offline_scan_goes_to_event_shard_stream(client, redis):
+    event_id = await create_event(client, name="Sharded Offline Event", ticket_count=2)
+    tickets = await list_tickets(client, event_id)
+    stream = offline_stream_key(offline_shard(event_id))
+
+    await client.post("/admin/offline", json={"enabled": True})
+    r = (await client.post("/admin/scan", json={"event_id": event_id, "ticket_id": tickets[0]["ticket_id"], "org_id": "org_1"})).json()
+    assert r["status"] == "PENDING_SYNC"
+
+    assert await redis.xlen(stream) == 1
+    assert not await redis.exists(LEGACY_OFFLINE_STREAM)
+    for shard in range(OFFLINE_STREAM_SHARDS):
+        if offline_stream_key(shard) != stream:
+            assert await redis.xlen(offline_stream_key(shard)) == 0
+
+    await client.post("/admin/offline", json={"enabled": False})
+
+    for _ in range(30):
+        if await redis.xlen(stream) == 0:
+            logs = (await client.get("/admin/audit", params={"limit": 50, "event_id": event_id})).json()
+            if any(x["decision_id"] == r["decision_id"] and x["reason_code"] == "OK_SYNCED" for x in logs):
+                return
+        await asyncio.sleep(1.0)
+
+    assert False, f"{stream} was not drained by the worker"